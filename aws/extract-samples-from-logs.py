@@ -4,61 +4,172 @@ EXPECT_NUM_RECEIVERS = 750
 
 
 import sys
+import os
 import re
 import pickle
-from collections import defaultdict
+import hashlib
+import argparse
+import json
 
 
-print(sys.argv)
-ID = sys.argv[1]
-assert(ID.isalnum())
+# logs arrive from S3 in waves, so ingestion is incremental: for every log file, the checkpoint
+# records how many bytes have been parsed so far and a hash of these bytes; together with the
+# samples parsed so far, this is written (atomically) to the checkpoint whenever another
+# --checkpoint-every MB of logs have been parsed, and at the end of the run (also if it is
+# interrupted between two files); re-running only parses files that are new or have grown since
+# the last checkpoint (files whose size and mtime are unchanged are not even read, and for the
+# others, the hash of the parsed prefix is checked), and merges them into the existing samples;
+# the completeness check happens only once all logs are in (finalize)
+#
+# usage:
+#   extract-samples-from-logs.py --no-finalize ID logs_ID/wave1/*.log   # ingest, do not finalize yet
+#   extract-samples-from-logs.py --no-finalize ID logs_ID/*/*.log       # ingest new/grown files only
+#   extract-samples-from-logs.py --regions regions.json ID logs_ID/*/*.log   # ingest remainder and finalize
 
-samples = defaultdict(lambda: {'t_tx': None, 'rxs': []})
 
-for (i_fn, fn) in enumerate(sys.argv[2:]):
-    print("File:", i_fn, fn)
+RE_RX = re.compile(r'Received by (i-[0-9a-f]+) at (\d+.\d+): Msg { origin: "(i-[0-9a-f]+)", seqno: (\d+), timestamp: (\d+.\d+) }')
+RE_TX = re.compile(r'Sent by (i-[0-9a-f]+) at (\d+.\d+): Msg { origin: "(i-[0-9a-f]+)", seqno: (\d+), timestamp: (\d+.\d+) }')
 
-    for l in open(fn, 'r').readlines():
+
+def atomic_pickle_dump(obj, filename):
+    # write to a temporary file first and then rename, so that a crash never leaves a truncated file
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def load_checkpoint(filename):
+    if not os.path.exists(filename):
+        return {'files': {}, 'samples': {}}
+    return pickle.load(open(filename, 'rb'))
+
+
+def ingest_lines(samples, lines):
+    for l in lines:
         l = l.strip()
         if 'Received by' in l:
             l = l.split('experiment::experiment] ')[1]
-            r = re.findall(r'Received by (i-[0-9a-f]+) at (\d+.\d+): Msg { origin: "(i-[0-9a-f]+)", seqno: (\d+), timestamp: (\d+.\d+) }', l)
+            r = RE_RX.findall(l)
             assert(len(r) == 1)
             (i_rx, t_rx, i_tx, seqno, t_tx) = r[0]
             t_rx = float(t_rx)
             t_tx = float(t_tx)
             seqno = int(seqno)
-            # print('rx', fn, (i_rx, t_rx, i_tx, seqno, t_tx))
+            # print('rx', (i_rx, t_rx, i_tx, seqno, t_tx))
 
-            assert({'i_rx': i_rx, 't_rx': t_rx} not in samples[(i_tx, seqno)]['rxs'])
-            samples[(i_tx, seqno)]['rxs'].append({'i_rx': i_rx, 't_rx': t_rx})
+            s = samples.setdefault((i_tx, seqno), {'t_tx': None, 'rxs': []})
+            assert({'i_rx': i_rx, 't_rx': t_rx} not in s['rxs'])
+            s['rxs'].append({'i_rx': i_rx, 't_rx': t_rx})
 
 
         elif 'Sent by' in l:
             l = l.split('experiment::experiment] ')[1]
-            r = re.findall(r'Sent by (i-[0-9a-f]+) at (\d+.\d+): Msg { origin: "(i-[0-9a-f]+)", seqno: (\d+), timestamp: (\d+.\d+) }', l)
+            r = RE_TX.findall(l)
             assert(len(r) == 1)
             (i_tx, t_tx, i_tx2, seqno, t_tx2) = r[0]
             t_tx = float(t_tx)
             t_tx2 = float(t_tx2)
             seqno = int(seqno)
-            # print('tx', fn, (i_tx, t_tx, i_tx2, seqno, t_tx2))
-
-            assert(samples[(i_tx, seqno)]['t_tx'] == None)
-            samples[(i_tx, seqno)]['t_tx'] = t_tx
-
-
-pickle.dump(dict(samples), open(f'samples_{ID}.pickle', 'wb'))
-
-
-samples_simplified = defaultdict(list)
-
-for (k, v) in samples.items():
-    t_tx = v['t_tx']
-    assert(len(v['rxs']) == EXPECT_NUM_RECEIVERS)
-    rxs = [ rx['t_rx'] - v['t_tx'] for rx in sorted(v['rxs'], key=lambda x: x['i_rx']) ]
-    samples_simplified[k[0]].append(rxs)
-
-
-pickle.dump(dict(samples_simplified), open(f'samples_simplified_{ID}.pickle', 'wb'))
-
+            # print('tx', (i_tx, t_tx, i_tx2, seqno, t_tx2))
+
+            s = samples.setdefault((i_tx, seqno), {'t_tx': None, 'rxs': []})
+            assert(s['t_tx'] == None)
+            s['t_tx'] = t_tx
+
+
+def ingest_file(checkpoint, fn):
+    # returns the number of newly parsed bytes
+    key = os.path.abspath(fn)
+    entry = checkpoint['files'].get(key, {'offset': 0, 'sha256': hashlib.sha256().hexdigest()})
+
+    # files that have not changed since they were last ingested are not read at all
+    st = os.stat(fn)
+    if (st.st_size, st.st_mtime_ns) == (entry.get('size'), entry.get('mtime_ns')):
+        return 0
+    assert(st.st_size >= entry['offset']), f"{fn} shrank since it was last ingested -- remove the checkpoint and start over"
+
+    with open(fn, 'rb') as f:
+        # make sure the part that was parsed before is unchanged (logs only ever grow)
+        prefix = f.read(entry['offset'])
+        h = hashlib.sha256(prefix)
+        assert(len(prefix) == entry['offset'] and h.hexdigest() == entry['sha256']), \
+            f"{fn} changed since it was last ingested -- remove the checkpoint and start over"
+        data = f.read()
+
+    # only consume complete lines; a trailing partial line is parsed once it is complete
+    end = data.rfind(b'\n') + 1
+    h.update(data[:end])
+    ingest_lines(checkpoint['samples'], data[:end].decode().splitlines())
+    # (size and mtime as of before reading, so that a file that grew meanwhile is read again)
+    checkpoint['files'][key] = {'offset': entry['offset'] + end, 'sha256': h.hexdigest(), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return end
+
+
+def finalize(samples, ID, regions=None):
+    atomic_pickle_dump(samples, f'samples_{ID}.pickle')
+
+    samples_simplified = {}
+    receivers = None
+
+    for (k, v) in samples.items():
+        assert(v['t_tx'] is not None), f"no transmission recorded for message {k}"
+        assert(len(v['rxs']) == EXPECT_NUM_RECEIVERS), f"message {k} has {len(v['rxs'])} of {EXPECT_NUM_RECEIVERS} receivers"
+        rxs = sorted(v['rxs'], key=lambda x: x['i_rx'])
+        if receivers is None:
+            receivers = [ rx['i_rx'] for rx in rxs ]
+        assert([ rx['i_rx'] for rx in rxs ] == receivers), f"message {k} reached a different set of receivers"
+        samples_simplified.setdefault(k[0], []).append([ rx['t_rx'] - v['t_tx'] for rx in rxs ])
+
+    atomic_pickle_dump(samples_simplified, f'samples_simplified_{ID}.pickle')
+
+    # same samples, but keeping track of who the receivers are (delays of every message are
+    # listed in the order of 'receivers') and where senders and receivers are located
+    # (instance id -> region, as saved by `fab generateconfig` or `fab regions`)
+    atomic_pickle_dump({
+        'receivers': receivers,
+        'regions': regions,
+        'samples': samples_simplified,
+    }, f'samples_indexed_{ID}.pickle')
+
+
+if __name__ == '__main__':
+    print(sys.argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--no-finalize', action='store_true', help="only ingest, skip completeness check and output")
+    parser.add_argument('--regions', help="regions.json (instance id -> region) of the testbed")
+    parser.add_argument('--checkpoint-every', type=int, default=256, help="write the checkpoint after this many MB of newly parsed logs")
+    parser.add_argument('ID')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    ID = args.ID
+    assert(ID.isalnum())
+
+    checkpoint_filename = f'checkpoint_{ID}.pickle'
+    checkpoint = load_checkpoint(checkpoint_filename)
+
+    # the whole checkpoint is rewritten every time, so do not write it after every file; it is
+    # only consistent between two files (ingest_file updates the samples before the offset)
+    unsaved = 0
+    consistent = True
+    try:
+        for (i_fn, fn) in enumerate(args.files):
+            consistent = False
+            n = ingest_file(checkpoint, fn)
+            consistent = True
+            print("File:", i_fn, fn, f"({n} new bytes)")
+            unsaved += n
+            if unsaved >= args.checkpoint_every * 2**20:
+                atomic_pickle_dump(checkpoint, checkpoint_filename)
+                unsaved = 0
+    finally:
+        if unsaved > 0 and consistent:
+            atomic_pickle_dump(checkpoint, checkpoint_filename)
+
+    print("Messages:", len(checkpoint['samples']))
+
+    if not args.no_finalize:
+        finalize(checkpoint['samples'], ID, json.load(open(args.regions)) if args.regions else None)
@@ -26,7 +26,7 @@ CREATE_NODES_PER_REGION = 50
 
 # AWS interface borrowed from: https://github.com/asonnino/hotstuff
 
-from fabric import task
+from fabric import task, ThreadingGroup
 import boto3
 from collections import defaultdict, OrderedDict
 import codecs
@@ -222,6 +222,11 @@ class InstanceManager:
         ids = [x for y in ids.values() for x in y] if flat else ids
         return (ids, ips)
 
+    def regions(self):
+        # instance id -> region; needed to interpret the logs by region after the testbed is gone
+        ids, _ = self._get(['pending', 'running'])
+        return {x: region for region, y in ids.items() for x in y}
+
     def print_info(self):
         (ids, hosts) = self.hosts_with_ids()
         key = AWS_EC2_KEY_PATH
@@ -301,6 +306,7 @@ def check(ctx):
 def generateconfig(ctx):
     im = InstanceManager()
     ids, ips = im._get(['pending', 'running'])
+    regions = {x: region for region, y in ids.items() for x in y}
     ips = [x for y in ips.values() for x in y]
     ids = [x for y in ids.values() for x in y]
 
@@ -323,11 +329,17 @@ def generateconfig(ctx):
         config['gossip']['nodes'][id] = node
 
     json.dump(config, open('config.json', 'w'), indent=4)
+    json.dump(regions, open('regions.json', 'w'), indent=4)
 
     print(ids, ips)
     print(config)
     ctx.run(f'md5sum config.json')
 
+@task
+def regions(ctx):
+    ''' Save the region of every machine (for extract-samples-from-logs.py --regions) '''
+    json.dump(InstanceManager().regions(), open('regions.json', 'w'), indent=4)
+
 @task
 def uploadconfig(ctx):
     ctx.run(f'cp config.json config_`md5sum config.json | awk \'{{ print $1; }}\'`.json')
@@ -338,3 +350,17 @@ def uploadconfig(ctx):
 def downloadlogs(ctx):
     ctx.run(f'mkdir -p logs_`md5sum config.json | awk \'{{ print $1; }}\'`')
     ctx.run(f'../venv/bin/aws s3 cp --recursive s3://{AWS_S3_BUCKET}/logs_`md5sum config.json | awk \'{{ print $1; }}\'` logs_`md5sum config.json | awk \'{{ print $1; }}\'`/')
+
+@task
+def sweepworkers(ctx, coordinator, authkey, processes=1):
+    ''' Start attack simulation sweep workers on all machines (coordinator: HOST:PORT of python -m gasper_attack.sweep --distributed ...) '''
+    # the coordinator has to be reachable from the machines, e.g., run it on one of them on a
+    # port in the range opened by the security group (GOSSIP_PORT ... GOSSIP_PORT+5000)
+    ctx.run('cd .. && zip -r aws/sweep.zip gasper_attack -x "*__pycache__*"')
+    hosts = InstanceManager().hosts(flat=True)
+    print(f'Starting sweep workers on {len(hosts)} machines')
+    g = ThreadingGroup(*hosts, user='ubuntu', connect_kwargs={'key_filename': AWS_EC2_KEY_PATH})
+    for c in g:
+        c.put('sweep.zip', 'sweep.zip')
+    g.run('rm -rf sweep && mkdir sweep && cd sweep && unzip -q ../sweep.zip')
+    g.run(f'cd sweep && (nohup python3 -m gasper_attack.distributed --coordinator {coordinator} --authkey {authkey} --processes {processes} > sweep.log 2>&1 &)')
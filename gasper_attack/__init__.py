@@ -0,0 +1,36 @@
+# simulations of the gasper balancing attack with measured gossip propagation delays
+#
+# names are re-exported lazily (PEP 562), so that `from gasper_attack import Scenario` only
+# imports the module that defines it; in particular, neither numpy nor matplotlib is imported
+# and no samples are loaded until they are actually needed
+
+import importlib
+
+
+_EXPORTS = {
+    'Scenario': 'gasper_attack.attack',
+    'RandomSchedule': 'gasper_attack.attack',
+    'BalanceTrace': 'gasper_attack.attack',
+    'run_attack_simulation': 'gasper_attack.attack',
+    'LazySampleStore': 'gasper_attack.delay_models',
+    'MeasuredGossipPropagationDelayModel': 'gasper_attack.delay_models',
+    'QuantileGossipPropagationDelayModel': 'gasper_attack.delay_models',
+    'RegionIndexedDelayStore': 'gasper_attack.delay_models',
+    'WorkUnit': 'gasper_attack.sweep',
+    'LocalBackend': 'gasper_attack.sweep',
+    'run_work_unit': 'gasper_attack.sweep',
+    'DistributedBackend': 'gasper_attack.distributed',
+    'attack_outcome_intervals': 'gasper_attack.analysis',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+from statistics import NormalDist
+import math
+
+import numpy as np
+
+
+# confidence intervals for the outcomes of attack simulations: an outcome is the number of slots
+# for which an attack stalled liveness, or 0 if the attack could not be launched; of interest are
+# the launch probability (fraction of outcomes > 0) and the mean stall duration (mean of the
+# outcomes > 0); bootstrap intervals are computed without materializing resampled outcome
+# arrays: the number of launched attacks in a resample is binomially distributed, so the
+# resampled launch probabilities are n_boot binomial draws; for the mean stall duration, the
+# distinct stall durations are grouped into at most max_bins bins of roughly equal counts (each
+# distinct value is its own bin if there are few), and a resample is described by how often it
+# draws from each bin (multinomial), plus the sum of the draws within each bin, which is
+# approximated by a normal with the bin's mean and variance (exact if every bin holds a single
+# value); so 10^6+ outcomes cost no more than a sort (np.unique) plus n_boot x max_bins,
+# however many distinct stall durations (e.g., of long-horizon runs) there are
+
+
+def z_value(level):
+    return NormalDist().inv_cdf(0.5 + level / 2)
+
+
+def wilson_interval(successes, n, level=0.95):
+    # analytic (Wilson score) interval for a binomial proportion
+    if n == 0:
+        return (None, None)
+    z = z_value(level)
+    p = successes / n
+    center = (p + z**2 / (2*n)) / (1 + z**2 / n)
+    halfwidth = z / (1 + z**2 / n) * math.sqrt(p * (1-p) / n + z**2 / (4*n**2))
+    return (max(0.0, center - halfwidth), min(1.0, center + halfwidth))
+
+
+def normal_interval(values, counts, level=0.95):
+    # analytic (normal approximation) interval for the mean of the values, each occurring counts times
+    m = counts.sum()
+    if m < 2:
+        return (None, None)
+    mean = (values * counts).sum() / m
+    var = (counts * (values - mean)**2).sum() / (m - 1)
+    halfwidth = z_value(level) * math.sqrt(var / m)
+    return (mean - halfwidth, mean + halfwidth)
+
+
+def value_bins(values, counts, max_bins):
+    # groups the (sorted, distinct) values into at most max_bins bins of roughly equal counts;
+    # returns count, mean and variance of every bin
+    if len(values) <= max_bins:
+        return (counts, values.astype(np.float64), np.zeros(len(values)))
+    b = (np.cumsum(counts) - counts) * max_bins // counts.sum()
+    bin_counts = np.bincount(b, weights=counts)
+    keep = bin_counts > 0
+    bin_counts = bin_counts[keep]
+    bin_means = np.bincount(b, weights=counts * values)[keep] / bin_counts
+    bin_vars = np.maximum(0.0, np.bincount(b, weights=counts * values.astype(np.float64)**2)[keep] / bin_counts - bin_means**2)
+    return (bin_counts.astype(np.int64), bin_means, bin_vars)
+
+
+def bootstrap_stall_sums(n_launched, bin_counts, bin_means, bin_vars, rng):
+    # sums of the resampled stall durations, for resamples with n_launched (array) launched attacks
+    c = rng.multinomial(n_launched, bin_counts / bin_counts.sum())
+    return c @ bin_means + np.sqrt(c @ bin_vars) * rng.standard_normal(len(n_launched))
+
+
+def attack_outcome_intervals(outcomes, level=0.95, n_boot=2000, seed=0, batch_size=None, max_bins=256):
+    # estimates and intervals (percentile bootstrap, and analytic) for the launch probability and
+    # the mean stall duration, from an array of outcomes; the intervals treat the number of
+    # outcomes as fixed (see sweep_result_intervals for outcomes of runs that stop after a given
+    # number of launched attacks)
+    (values, counts) = np.unique(np.asarray(outcomes), return_counts=True)
+    launched = values > 0
+    n = int(counts.sum())
+    n_launched = int(counts[launched].sum())
+    if n == 0:
+        return {
+            'launch_probability': None, 'launch_probability_ci': (None, None), 'launch_probability_wilson': (None, None),
+            'mean_stall': None, 'mean_stall_ci': (None, None), 'mean_stall_normal': (None, None),
+        }
+
+    rng = np.random.default_rng(seed)
+    boot_n_launched = rng.binomial(n, n_launched / n, n_boot)
+    boot_launch = boot_n_launched / n
+
+    # resamples without any launched attack have no mean stall duration
+    boot_n_launched = boot_n_launched[boot_n_launched > 0]
+    boot_stall = []
+    if n_launched:
+        bins = value_bins(values[launched], counts[launched], max_bins)
+        # bound the size of each batch of count vectors to ~10^7 entries
+        batch_size = batch_size or max(1, 10**7 // len(bins[0]))
+        for start in range(0, len(boot_n_launched), batch_size):
+            m = boot_n_launched[start:start+batch_size]
+            boot_stall.append(bootstrap_stall_sums(m, *bins, rng) / m)
+    boot_stall = np.concatenate(boot_stall) if boot_stall else np.zeros(0)
+
+    q = [ (1 - level) / 2 * 100, (1 + level) / 2 * 100 ]
+    return {
+        'launch_probability': n_launched / n,
+        'launch_probability_ci': tuple(float(x) for x in np.percentile(boot_launch, q)),
+        'launch_probability_wilson': wilson_interval(n_launched, n, level),
+        'mean_stall': float((values[launched] * counts[launched]).sum() / n_launched) if n_launched else None,
+        'mean_stall_ci': tuple(float(x) for x in np.percentile(boot_stall, q)) if len(boot_stall) else (None, None),
+        'mean_stall_normal': tuple(None if x is None else float(x) for x in normal_interval(values[launched], counts[launched], level)),
+    }
+
+
+def sweep_result_intervals(result, level=0.95, n_boot=2000, seed=0):
+    # intervals for a result of gasper_attack.sweep.run_work_unit, whose outcomes are the
+    # stalls of the launched attacks and a 0 for every other try
+    # the tries stop once num_launched attacks were launched, so the number of tries is random
+    # (negative binomial) rather than fixed, as the intervals assume: with few launches, the
+    # launch probability launched/tries is biased upwards ((launched-1)/(tries-1) is unbiased)
+    # and its intervals are only approximate; the mean stall intervals are not affected (they
+    # are conditional on the number of launched attacks anyway)
+    outcomes = np.zeros(result['tries'], dtype=np.int64)
+    outcomes[:len(result['stalls'])] = result['stalls']
+    return attack_outcome_intervals(outcomes, level, n_boot, seed)
@@ -0,0 +1,385 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from array import array
+import functools
+import random
+import copy
+import collections
+import os
+import pickle
+
+
+@dataclass
+class Scenario(object):
+    C: int   # number of slots per epoch
+    N: int   # number of validators
+    F: int   # number of adversarial validators
+
+    def __post_init__(self):
+        assert (self.N % self.C) == 0
+
+    def slot_to_epoch(self, slot):
+        return (slot // self.C, slot % self.C)
+
+    def committee_size(self):
+        return self.N // self.C
+
+    def is_adversarial(self, i):
+        return i < self.F
+
+    def is_honest(self, i):
+        return not self.is_adversarial(i)
+
+    def all_parties(self):
+        return range(self.N)
+
+
+@functools.lru_cache(maxsize=1024)
+def epoch_permutation(N, seed):
+    # random order of all parties, from which the committees of an epoch are cut; this only
+    # depends on the number of validators and the seed (not on C or F), and every simulation
+    # run with the same random try uses the same seeds, so it is cached across runs; stored as
+    # a compact array (2 bytes per party for up to 65536 validators, i.e., 8 kB at N = 4096),
+    # so that a full cache stays at a few MB even when long-horizon runs fill it
+    rng = random.Random(seed)
+    committees = list(range(N))
+    rng.shuffle(committees)
+    return array('H' if N <= 2**16 else 'L', committees)
+
+
+@dataclass
+class RandomSchedule(object):
+    scenario: Scenario
+    randomness: int
+
+    def committee_for_slot(self, slot):
+        (epoch, slot_within_block) = self.scenario.slot_to_epoch(slot)
+        committee_size = self.scenario.committee_size()
+
+        committees = epoch_permutation(self.scenario.N, self.randomness + epoch)
+
+        return committees[(slot_within_block*committee_size):((slot_within_block+1)*committee_size)]
+
+    def committee_fractions_for_slot(self, slot):
+        committee = self.committee_for_slot(slot)
+        return ({ i for i in committee if self.scenario.is_adversarial(i) }, { i for i in committee if self.scenario.is_honest(i) })
+
+    def proposer_for_slot(self, slot):
+        committee = self.committee_for_slot(slot)
+        return committee[0]
+
+    def role_assignment_for_attack(self):
+        # slots 0 and 1 need to have adversarial proposers who will propose two competing blocks
+        # and will show them to honest validators only at the beginning of slot 2
+        # (with this modification, it becomes harder to launch the attack, but there is no harm
+        # in launching it over and over again, as there is no formal equivocation anymore)
+        adv_proposer_slot0 = None
+        adv_proposer_slot1 = None
+
+        # make sure the proposers in slots 0 and 1 are adversarial
+        prop0 = self.proposer_for_slot(0)
+        prop1 = self.proposer_for_slot(1)
+        if not (self.scenario.is_adversarial(prop0) and self.scenario.is_adversarial(prop1)):
+            # print(" -> proposers in slots 0 and 1 are not adversarial")
+            return (False, None)
+        else:
+            adv_proposer_slot0 = prop0
+            adv_proposer_slot1 = prop1
+
+        return (True, (adv_proposer_slot0, adv_proposer_slot1,))
+
+    def is_attack_feasible(self):
+        (ret, roles) = self.role_assignment_for_attack()
+        return ret
+
+
+@dataclass
+class BalanceTrace(object):
+    # bounded-memory record of the balance (votes LEFT, votes RIGHT) after the honest votes of
+    # each slot: only every stride-th slot is kept, and of those only the most recent maxlen
+    # (ring buffer; maxlen=None keeps all of them); summary statistics cover all slots
+    maxlen: int = None
+    stride: int = 1
+    balances: collections.deque = None
+    num_slots: int = 0
+    max_imbalance: int = 0
+    max_imbalance_slot: int = None
+    adv_votes_remaining: int = None
+    min_adv_votes_remaining: int = None
+
+    def __post_init__(self):
+        if self.balances is None:
+            self.balances = collections.deque(maxlen=self.maxlen)
+
+    def record(self, slot, balance, adv_votes_remaining):
+        if self.num_slots % self.stride == 0:
+            self.balances.append((slot, balance))
+        self.num_slots += 1
+
+        imbalance = abs(balance[0] - balance[1])
+        if imbalance > self.max_imbalance:
+            self.max_imbalance = imbalance
+            self.max_imbalance_slot = slot
+
+        # adversarial validators that can still release a vote to rebalance
+        self.adv_votes_remaining = adv_votes_remaining
+        if self.min_adv_votes_remaining is None or adv_votes_remaining < self.min_adv_votes_remaining:
+            self.min_adv_votes_remaining = adv_votes_remaining
+
+    def __len__(self):
+        return len(self.balances)
+
+    def __iter__(self):
+        return iter(self.balances)
+
+
+def write_checkpoint(state, filename):
+    # returns the checkpointed state as it would be read back from disk (see below)
+    blob = pickle.dumps(state)
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+    return pickle.loads(blob)
+
+
+def run_attack_simulation(scenario, gossip_propagation_samples, num_slots_simulate, rnd_try, T_delay, balances=None, checkpoint=None, checkpoint_every=None):
+    # for long horizons: pass a bounded BalanceTrace as balances (by default, all slots are kept),
+    # and a checkpoint filename; every checkpoint_every slots, the simulation state (votes,
+    # adversarial validators with outstanding votes, RNG state, balance trace) is saved there,
+    # and if the file exists, the simulation resumes from it; the run continues with the state
+    # as read back from the checkpoint (rather than the in-memory one), so that a resumed run
+    # proceeds exactly like an uninterrupted one (in particular, the order in which sets pop);
+    # once the run is over, the checkpoint is removed (so the filename can be reused); a
+    # checkpoint is only resumed by the same run (scenario, random try, T_delay, horizon, and
+    # delay model, as identified by its fingerprint())
+    VOTED_N = 0   # never
+    VOTED_G = 1   # genesis
+    VOTED_L = 2   # left
+    VOTED_R = 3   # right
+
+    def balance(lmd):
+        return (lmd.count(VOTED_L), lmd.count(VOTED_R))
+
+    def leading(lmd):
+        if lmd.count(VOTED_L) > lmd.count(VOTED_R):
+            return VOTED_L
+        elif lmd.count(VOTED_L) < lmd.count(VOTED_R):
+            return VOTED_R
+        elif lmd.count(VOTED_L) == lmd.count(VOTED_R):
+            return None
+        else:
+            assert False
+
+
+    if balances is None:
+        balances = BalanceTrace()
+
+    schedule = RandomSchedule(scenario, 42 + rnd_try)
+    (attack_feasible, attack_roles) = schedule.role_assignment_for_attack()
+    if not attack_feasible:
+        return (0, balances)
+
+
+    (adv_proposer_slot0, adv_proposer_slot1,) = attack_roles
+    # print("adversarial proposer in slot 0:", adv_proposer_slot0)
+    # print("adversarial proposer in slot 1:", adv_proposer_slot1)
+
+
+    # set up latest votes as seen globally
+    lmd = [ VOTED_N for i in scenario.all_parties() ]
+
+    # set up global randomness (for reproducibility)
+    rng = random.Random(42*42 + rnd_try)
+
+
+    # keep track of which adversarial committee members can still release a new vote
+    cm_adv_can_effect_2_L = set()
+    cm_adv_can_effect_2_R = set()
+    cm_adv_can_effect_1_L = set()
+    cm_adv_can_effect_1_R = set()
+
+    first_slot = 0
+    run = None
+    if checkpoint is not None:
+        run = (scenario, rnd_try, T_delay, num_slots_simulate, gossip_propagation_samples.fingerprint())
+
+
+    def save_and_restore_state(slot):
+        state = write_checkpoint({
+            'run': run,
+            'slot': slot,
+            'lmd': lmd,
+            'rng': rng,
+            'cm_adv_can_effect': (cm_adv_can_effect_2_L, cm_adv_can_effect_2_R, cm_adv_can_effect_1_L, cm_adv_can_effect_1_R),
+            'balances': balances,
+        }, checkpoint)
+        return restore_state(state)
+
+    def restore_state(state):
+        assert state['run'] == run, "checkpoint belongs to a different run"
+        return (state['slot'] + 1, state['lmd'], state['rng'], state['cm_adv_can_effect'], state['balances'])
+
+    def finish(slot):
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return (slot, balances)
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        (first_slot, lmd, rng, cm_adv_can_effect, balances) = restore_state(pickle.load(open(checkpoint, 'rb')))
+        (cm_adv_can_effect_2_L, cm_adv_can_effect_2_R, cm_adv_can_effect_1_L, cm_adv_can_effect_1_R) = cm_adv_can_effect
+        # print(f"resuming from checkpoint at slot {first_slot}")
+
+
+    slot = first_slot - 1
+    for slot in range(first_slot, num_slots_simulate):
+        (cm_adv, cm_hon) = schedule.committee_fractions_for_slot(slot)
+
+        if slot == 0:
+            # in slots 0 and 1 the adversary is proposer and proposes two conflicting
+            # blocks, but does not release them until the beginning of slot 2;
+            # in slot 0, the proposal is LEFT, so adversarial validators from that
+            # slot can later only reveal votes for LEFT
+
+            cm_adv_can_effect_2_L |= { i for i in cm_adv if lmd[i] == VOTED_R }
+            cm_adv_can_effect_1_L |= { i for i in cm_adv if lmd[i] == VOTED_N }
+
+        elif slot == 1:
+            # in slots 0 and 1 the adversary is proposer and proposes two conflicting
+            # blocks, but does not release them until the beginning of slot 2;
+            # in slot 1, the proposal is RIGHT, so adversarial validators from that
+            # slot can later reveal votes for either LEFT or RIGHT
+
+            cm_adv_can_effect_2_L |= { i for i in cm_adv if lmd[i] == VOTED_R }
+            cm_adv_can_effect_2_R |= { i for i in cm_adv if lmd[i] == VOTED_L }
+            cm_adv_can_effect_1_L |= { i for i in cm_adv if lmd[i] == VOTED_N }
+            cm_adv_can_effect_1_R |= { i for i in cm_adv if lmd[i] == VOTED_N }
+
+        elif slot >= 2:
+            # slot >= 2: chains are balanced; tie breaks in favor of LEFT block vs.
+            # RIGHT block; adv uses sway vote from earlier slots to tip balance
+            # in favor of RIGHT block; => if T > T_delay, then validator votes
+            # LEFT (favored by tie break), otherwise validator votes RIGHT (as it
+            # has seen the tipping vote before proceeding to vote)
+
+            assert not leading(lmd)
+
+            # find an adversarial validator who can still release a vote for RIGHT
+            # `in the past'; release this vote T_delay before honest validators take
+            # a vote, so that ideally roughly half of honest validators in this slot
+            # vote LEFT and the other half votes RIGHT, so that the adversary has a
+            # good chance to rebalance to a tie with remaining adversarial votes
+            i_swayer = None
+            if len(cm_adv_can_effect_1_R) > 0:
+                i_swayer = cm_adv_can_effect_1_R.pop()
+            elif len(cm_adv_can_effect_2_R) > 0:
+                i_swayer = cm_adv_can_effect_2_R.pop()
+            else:
+                # raise Exception("not enough adversarial validators to balance -- liveness attack over!")
+                return finish(slot)
+
+            lmd_beforeT = copy.copy(lmd)
+            lmd_afterT = copy.copy(lmd)
+
+            lmd_afterT[i_swayer] = VOTED_R
+            lmd[i_swayer] = VOTED_R
+
+            cm_adv_can_effect_2_L = cm_adv_can_effect_2_L - {i_swayer,}
+            cm_adv_can_effect_2_R = cm_adv_can_effect_2_R - {i_swayer,}
+            cm_adv_can_effect_1_L = cm_adv_can_effect_1_L - {i_swayer,}
+            cm_adv_can_effect_1_R = cm_adv_can_effect_1_R - {i_swayer,}
+
+            assert not leading(lmd_beforeT)
+            assert leading(lmd_afterT) == VOTED_R
+
+            # sample the propagation delays for a random message
+            gossip_propagation_instance = gossip_propagation_samples.sample(rng)
+            # for the chosen message, sample the propagation delays of random receivers
+            gossip_propagation_delays = gossip_propagation_instance.sample(rng, len(cm_hon))
+            for (i, T) in zip(cm_hon, gossip_propagation_delays):
+                if T > T_delay:
+                    # votes LEFT
+                    lmd[i] = VOTED_L
+
+                else:
+                    # votes RIGHT
+                    lmd[i] = VOTED_R
+
+            # check and record the balance
+            # print(f"slot {slot} balance after honest votes:", balance(lmd))
+            balances.record(slot, balance(lmd), len(cm_adv_can_effect_2_L | cm_adv_can_effect_2_R | cm_adv_can_effect_1_L | cm_adv_can_effect_1_R))
+
+            # add current committee members to adversarial validators with outstanding
+            # votes; these validators can eventually release votes to balance the chains,
+            # now or in the future
+            cm_adv_can_effect_2_L |= { i for i in cm_adv if lmd[i] == VOTED_R }
+            cm_adv_can_effect_2_R |= { i for i in cm_adv if lmd[i] == VOTED_L }
+            cm_adv_can_effect_1_L |= { i for i in cm_adv if lmd[i] == VOTED_N }
+            cm_adv_can_effect_1_R |= { i for i in cm_adv if lmd[i] == VOTED_N }
+
+        else:
+            assert False
+
+        # attempt to re-balance (greedily)
+        while leading(lmd):
+            i = None
+
+            if balance(lmd)[0] - balance(lmd)[1] >= 2:
+                # >= 2 votes more for Left
+                if len(cm_adv_can_effect_2_R) > 0:
+                    i = cm_adv_can_effect_2_R.pop()
+                    lmd[i] = VOTED_R
+                elif len(cm_adv_can_effect_1_R) > 0:
+                    i = cm_adv_can_effect_1_R.pop()
+                    lmd[i] = VOTED_R
+                else:
+                    # raise Exception("not enough adversarial validators to balance -- liveness attack over!")
+                    return finish(slot)
+            elif balance(lmd)[0] - balance(lmd)[1] >= 1:
+                # >= 2 votes more for Left
+                if len(cm_adv_can_effect_1_R) > 0:
+                    i = cm_adv_can_effect_1_R.pop()
+                    lmd[i] = VOTED_R
+                else:
+                    # raise Exception("not enough adversarial validators to balance -- liveness attack over!")
+                    return finish(slot)
+            elif balance(lmd)[0] - balance(lmd)[1] <= -2:
+                # >= 2 votes more for Left
+                if len(cm_adv_can_effect_2_L) > 0:
+                    i = cm_adv_can_effect_2_L.pop()
+                    lmd[i] = VOTED_L
+                elif len(cm_adv_can_effect_1_L) > 0:
+                    i = cm_adv_can_effect_1_L.pop()
+                    lmd[i] = VOTED_L
+                else:
+                    # raise Exception("not enough adversarial validators to balance -- liveness attack over!")
+                    return finish(slot)
+            elif balance(lmd)[0] - balance(lmd)[1] <= -1:
+                # >= 2 votes more for Left
+                if len(cm_adv_can_effect_1_L) > 0:
+                    i = cm_adv_can_effect_1_L.pop()
+                    lmd[i] = VOTED_L
+                else:
+                    # raise Exception("not enough adversarial validators to balance -- liveness attack over!")
+                    return finish(slot)
+            else:
+                assert False
+
+            assert not i is None
+            cm_adv_can_effect_2_L -= {i,}
+            cm_adv_can_effect_2_R -= {i,}
+            cm_adv_can_effect_1_L -= {i,}
+            cm_adv_can_effect_1_R -= {i,}
+
+        # check the balance
+        # print(f"slot {slot} balance after adversarial balancing votes:", balance(lmd))
+
+        assert not leading(lmd)
+
+        if checkpoint is not None and checkpoint_every and (slot + 1) % checkpoint_every == 0 and slot + 1 < num_slots_simulate:
+            (_, lmd, rng, cm_adv_can_effect, balances) = save_and_restore_state(slot)
+            (cm_adv_can_effect_2_L, cm_adv_can_effect_2_R, cm_adv_can_effect_1_L, cm_adv_can_effect_1_R) = cm_adv_can_effect
+
+    return finish(slot)
@@ -0,0 +1,351 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from array import array
+import bisect
+import functools
+import hashlib
+import itertools
+import math
+import pickle
+import sys
+
+
+# the measured samples that come with this repository (see gasper_attack.measured_gossip_delay)
+SAMPLES_FILENAME = "samples_simplified_afcf8c74bc552b0506a3a1c58f74c2ac.pickle"
+
+
+def load_sender_samples(filename, node=0):
+    # the pickle maps sender instance ids to lists of messages, each message being the list of
+    # propagation delays to all receivers (sorted by receiver instance id); senders are
+    # numbered by the order of their instance ids
+    all_samples = pickle.load(open(filename, "rb"))
+    return all_samples[sorted(all_samples.keys())[node]]
+
+
+class LazySampleStore(object):
+    # samples_simplified_ID.pickle, loaded on first use rather than on construction (so that
+    # creating a store, e.g., at import time or in a freshly started worker, costs nothing), and
+    # the delay models built from it, cached per (node, eps); alternatively, samples that are
+    # already loaded can be passed in directly
+    def __init__(self, filename=None, samples=None):
+        assert (filename is None) != (samples is None)
+        self.filename = filename
+        self._samples = samples
+        self._models = {}
+
+    def samples(self):
+        if self._samples is None:
+            self._samples = pickle.load(open(self.filename, "rb"))
+        return self._samples
+
+    def senders(self):
+        return sorted(self.samples().keys())
+
+    def model(self, node=0, eps=None):
+        # MeasuredGossipPropagationDelayModel of the node-th sender, or with eps, its
+        # QuantileGossipPropagationDelayModel
+        key = (node, eps)
+        if key not in self._models:
+            samples = self.samples()[self.senders()[node]]
+            if eps is None:
+                self._models[key] = MeasuredGossipPropagationDelayModel(samples)
+            else:
+                self._models[key] = QuantileGossipPropagationDelayModel.from_samples(samples, eps)
+        return self._models[key]
+
+
+@dataclass
+class MeasuredGossipPropagationDelayModel(object):
+    samples: list
+    sorted_samples: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+    _fingerprint: str = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def load(cls, filename, node=0):
+        # these gossip propagation delay samples were obtained as follows:
+        # nodes were connected in a libp2p gossipsub swarm; some nodes send beacon messages;
+        # all nodes log when they receive each message for the first time; later, the logs
+        # are collected and for each message and each receiver the delay is recorded;
+        # the samples are grouped first by sender, then by message, then by receiver.
+        # here, we load the set of messages sent by a particular sending node; the
+        # propagation delay for adversarial messages to their receivers is modelled by
+        # using the measured delays of a randomly chosen message of that sender, to
+        # a randomly chosen receiver (but without replacement of receivers);
+        # MeasuredGossipPropagationDelayModel handles the sampling of messages,
+        # MeasuredGossipPropagationDelayModelInstance handles sampling receivers.
+        return cls(load_sender_samples(filename, node))
+
+    def __len__(self):
+        return len(self.samples)
+
+    def instance(self, i):
+        return MeasuredGossipPropagationDelayModelInstance(self.samples[i])
+
+    def sample(self, rng):
+        return MeasuredGossipPropagationDelayModelInstance(rng.choice(self.samples))
+
+    def order_statistic_sampler(self, i_msg, k, i):
+        # sampler for the i-th smallest of k delays of message i_msg; the delays of every message
+        # are sorted once, and the weights (which only depend on the number of receivers, k and i)
+        # are shared by all messages, see order_statistic_cum_weights
+        if i_msg not in self.sorted_samples:
+            self.sorted_samples[i_msg] = sorted(self.samples[i_msg])
+        values = self.sorted_samples[i_msg]
+        return OrderStatisticSampler(values, order_statistic_cum_weights(len(values), k, i))
+
+    def fraction_below(self, T):
+        return sum(MeasuredGossipPropagationDelayModelInstance(s).fraction_below(T) for s in self.samples) / len(self.samples)
+
+    def nbytes(self):
+        return sys.getsizeof(self.samples) + sum(sys.getsizeof(s) + sum(sys.getsizeof(x) for x in s) for s in self.samples)
+
+    def fingerprint(self):
+        # hash of the delays (e.g., to tell which model a checkpointed simulation was run with)
+        if self._fingerprint is None:
+            h = hashlib.sha256(b'measured')
+            for s in self.samples:
+                h.update(len(s).to_bytes(4, 'little'))
+                h.update(array('d', s).tobytes())
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+
+@dataclass
+class MeasuredGossipPropagationDelayModelInstance(object):
+    samples: list
+
+    def sample(self, rng, k):
+        return rng.sample(self.samples, k)
+
+    def fraction_below(self, T):
+        return sum(1 for x in self.samples if x < T) / len(self.samples)
+
+
+@functools.lru_cache(maxsize=4096)
+def order_statistic_cum_weights(n, k, i):
+    # distribution of the i-th smallest (counting from 0) of k out of n values drawn without
+    # replacement, tabulated exactly: with the values sorted, the i-th smallest of the k is the
+    # j-th smallest overall with probability comb(j, i) * comb(n-1-j, k-1-i) / comb(n, k);
+    # returned as cumulative weights over j
+    assert 0 <= i < k <= n
+    return array('d', itertools.accumulate(math.comb(j, i) * math.comb(n-1-j, k-1-i) / math.comb(n, k) for j in range(n)))
+
+
+class OrderStatisticSampler(object):
+    # the i-th smallest of k delays of a message, with the k receivers drawn without replacement
+    # (as by MeasuredGossipPropagationDelayModelInstance): sampling is by bisection in the
+    # cumulative weights (see order_statistic_cum_weights) over the sorted delays, instead of
+    # drawing and sorting k delays every time; holds references only, so it is cheap to create
+    def __init__(self, values, cum_weights):
+        assert len(values) == len(cum_weights)
+        self.values = values
+        self.cum_weights = cum_weights
+
+    def sample(self, rng):
+        j = bisect.bisect_right(self.cum_weights, rng.random() * self.cum_weights[-1])
+        return self.values[min(j, len(self.values) - 1)]
+
+
+@dataclass
+class QuantileOrderStatisticSampler(object):
+    # same for the quantile summary, whose receivers are drawn independently: the i-th smallest
+    # of k independent uniforms is Beta(i+1, k-i) distributed, and is mapped through the quantiles
+    instance: QuantileGossipPropagationDelayModelInstance
+    k: int
+    i: int
+
+    def sample(self, rng):
+        return self.instance.quantile(rng.betavariate(self.i + 1, self.k - self.i))
+
+
+@dataclass
+class QuantileGossipPropagationDelayModel(object):
+    # compact alternative to MeasuredGossipPropagationDelayModel: instead of the raw delays to
+    # all receivers, each message is summarized by a table of Q+1 evenly spaced quantiles
+    # (probabilities 0, 1/Q, ..., 1), with linear interpolation in between; the CDF of the
+    # summary deviates from the empirical CDF by at most ~1/Q (plus interpolation within a
+    # quantile cell), so Q = ceil(1/eps) for a rank error bound eps; all tables are stored
+    # back-to-back in a single float32 array, which keeps the model small enough to stay in
+    # cache; sampling is by inverse-CDF lookup in O(1), and receivers are drawn independently
+    # (i.e., with replacement) rather than without replacement
+    Q: int
+    tables: array = field(repr=False)
+    _fingerprint: str = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_samples(cls, samples, eps=0.01):
+        Q = max(1, math.ceil(1 / eps))
+        tables = array('f')
+        for s in samples:
+            s = sorted(s)
+            for j in range(Q + 1):
+                # quantile at probability j/Q, interpolating between order statistics
+                pos = j / Q * (len(s) - 1)
+                lo = int(pos)
+                hi = min(lo + 1, len(s) - 1)
+                tables.append(s[lo] + (pos - lo) * (s[hi] - s[lo]))
+        return cls(Q, tables)
+
+    @classmethod
+    def load(cls, filename, node=0, eps=0.01):
+        return cls.from_samples(load_sender_samples(filename, node), eps)
+
+    def __len__(self):
+        return len(self.tables) // (self.Q + 1)
+
+    def instance(self, i):
+        return QuantileGossipPropagationDelayModelInstance(self.Q, self.tables, i*(self.Q+1))
+
+    def sample(self, rng):
+        return self.instance(rng.randrange(len(self)))
+
+    def order_statistic_sampler(self, i_msg, k, i):
+        return QuantileOrderStatisticSampler(self.instance(i_msg), k, i)
+
+    def fraction_below(self, T):
+        return sum(self.instance(i).fraction_below(T) for i in range(len(self))) / len(self)
+
+    def nbytes(self):
+        return sys.getsizeof(self.tables)
+
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = hashlib.sha256(b'quantile' + self.Q.to_bytes(4, 'little') + self.tables.tobytes()).hexdigest()
+        return self._fingerprint
+
+
+@dataclass
+class QuantileGossipPropagationDelayModelInstance(object):
+    # a view into the shared table array of the model, starting at offset
+    Q: int
+    tables: array = field(repr=False)
+    offset: int
+
+    def quantile(self, u):
+        pos = u * self.Q
+        j = min(int(pos), self.Q - 1)
+        (lo, hi) = (self.tables[self.offset+j], self.tables[self.offset+j+1])
+        return lo + (pos - j) * (hi - lo)
+
+    def sample(self, rng, k):
+        return [ self.quantile(rng.random()) for _ in range(k) ]
+
+    def fraction_below(self, T):
+        # inverse of quantile(): locate the quantile cell containing T and interpolate
+        (first, last) = (self.offset, self.offset + self.Q)
+        if T <= self.tables[first]:
+            return 0.0
+        if T > self.tables[last]:
+            return 1.0
+        j = bisect.bisect_left(self.tables, T, first, last + 1) - 1
+        (lo, hi) = (self.tables[j], self.tables[j+1])
+        return (j - first + ((T - lo) / (hi - lo) if hi > lo else 1.0)) / self.Q
+
+
+ANY = '*'
+
+
+@dataclass
+class RegionIndexedDelayStore(object):
+    # the samples of samples_indexed_ID.pickle (see aws/extract-samples-from-logs.py), which
+    # unlike samples_simplified_ID.pickle keep track of the receiver of each delay and of the
+    # region of every instance; on load, the delays are regrouped by (sender region, receiver
+    # region), with ANY as a wildcard for either, so that conditional draws such as "delay from
+    # a sender in us-east-1 to a receiver in eu-west-1" are O(1) lookups instead of full scans
+    receivers: list   # receiver instance ids, in the order of the delays of every message
+    regions: dict     # instance id -> region (None if the region map was not available)
+    samples: dict     # sender instance id -> list of messages -> list of delays
+
+    def __post_init__(self):
+        self.regions = self.regions or {}
+        self.senders = sorted(self.samples.keys())
+        self.receiver_index = { r: i for (i, r) in enumerate(self.receivers) }
+
+        self.receivers_by_region = {}
+        for (i, r) in enumerate(self.receivers):
+            for rr in (self.region(r), ANY):
+                self.receivers_by_region.setdefault(rr, []).append(i)
+
+        # per (sender region, receiver region): every message, restricted to the receivers in
+        # that region, and all of these delays in one flat array for direct sampling
+        self.messages_by_regions = {}
+        self.delays_by_regions = {}
+        for s in self.senders:
+            for sr in (self.region(s), ANY):
+                for msg in self.samples[s]:
+                    for (rr, idx) in self.receivers_by_region.items():
+                        m = [ msg[i] for i in idx ]
+                        self.messages_by_regions.setdefault((sr, rr), []).append(m)
+                        self.delays_by_regions.setdefault((sr, rr), array('d')).extend(m)
+
+    @classmethod
+    def load(cls, filename):
+        d = pickle.load(open(filename, "rb"))
+        return cls(d['receivers'], d['regions'], d['samples'])
+
+    def region(self, instance):
+        return self.regions.get(instance)
+
+    def all_regions(self):
+        return sorted({ rr for rr in self.receivers_by_region.keys() if rr != ANY }, key=str)
+
+    def delay(self, sender, message, receiver):
+        # delay of the message-th message of sender (instance id) to receiver (instance id)
+        return self.samples[sender][message][self.receiver_index[receiver]]
+
+    def sample_delay(self, rng, sender_region=ANY, receiver_region=ANY):
+        # delay of a random message from a sender in sender_region to a random receiver in receiver_region
+        return rng.choice(self.delays_by_regions[(sender_region, receiver_region)])
+
+    def model(self, sender_region=ANY, receiver_region=ANY):
+        # delay model (as used by the simulations) over all messages of senders in sender_region,
+        # with receivers drawn from receiver_region only
+        return MeasuredGossipPropagationDelayModel(self.messages_by_regions[(sender_region, receiver_region)])
+
+    def sender_model(self, node, receiver_region=ANY):
+        # like MeasuredGossipPropagationDelayModel.load(..., node=node), but with receivers
+        # drawn from receiver_region only
+        idx = self.receivers_by_region[receiver_region]
+        return MeasuredGossipPropagationDelayModel([ [ msg[i] for i in idx ] for msg in self.samples[self.senders[node]] ])
+
+
+def fidelity_report(samples, eps=0.01):
+    # compare the quantile summary against the raw measurements it was built from: memory
+    # footprint, and the largest deviation between the empirical CDF of a message and the
+    # CDF of its summary (Kolmogorov-Smirnov distance), evaluated at all measured delays
+    measured = MeasuredGossipPropagationDelayModel(samples)
+    sketch = QuantileGossipPropagationDelayModel.from_samples(samples, eps)
+
+    ks = []
+    for (i, s) in enumerate(samples):
+        s = sorted(s)
+        inst = sketch.instance(i)
+        d = 0.0
+        for x in s:
+            # the empirical CDF jumps from (#delays < x)/n to (#delays <= x)/n at x
+            F = inst.fraction_below(x)
+            d = max(d, abs(F - bisect.bisect_left(s, x) / len(s)), abs(F - bisect.bisect_right(s, x) / len(s)))
+        ks.append(d)
+
+    return {
+        'eps': eps,
+        'Q': sketch.Q,
+        'messages': len(samples),
+        'bytes_measured': measured.nbytes(),
+        'bytes_quantile': sketch.nbytes(),
+        'ks_max': max(ks),
+        'ks_mean': sum(ks) / len(ks),
+    }
+
+
+if __name__ == '__main__':
+    # usage: python -m gasper_attack.delay_models samples_simplified_ID.pickle [eps ...]
+    filename = sys.argv[1]
+    all_eps = [ float(x) for x in sys.argv[2:] ] or [0.05, 0.02, 0.01, 0.005]
+    for node in range(len(pickle.load(open(filename, "rb")))):
+        samples = load_sender_samples(filename, node)
+        for eps in all_eps:
+            r = fidelity_report(samples, eps)
+            print(f"node {node}: eps = {eps}, Q = {r['Q']}, {r['messages']} messages, "
+                  f"{r['bytes_measured']} -> {r['bytes_quantile']} bytes ({r['bytes_measured'] / r['bytes_quantile']:.0f}x), "
+                  f"KS distance max {r['ks_max']:.4f} / mean {r['ks_mean']:.4f}")
@@ -0,0 +1,248 @@
+from __future__ import annotations
+from multiprocessing.managers import BaseManager
+import argparse
+import multiprocessing
+import pickle
+import queue
+import secrets
+import sys
+import threading
+import time
+import traceback
+
+from gasper_attack import sweep
+from gasper_attack.delay_models import LazySampleStore
+
+
+# distributed backend for gasper_attack.sweep: the coordinator serves a work queue (and the
+# sample store) with multiprocessing.managers over TCP; workers connect, pull the sample store
+# once, then take work units off the queue and send back the results until the coordinator
+# tells them to stop; DistributedBackend has the same interface as sweep.LocalBackend
+#
+# messages from workers to the coordinator (on the results queue):
+#   ('taken', unit)          a worker took the unit off the queue, and holds a lease on it
+#   ('renew', unit)          ... and is still working on it (sent every third of the lease)
+#   ('done', unit, result)
+#   ('error', unit, (exception, traceback))
+#   ('failed', None, (exception, traceback))   a worker could not start (e.g., bad samples)
+# units whose lease expired (because their worker died or lost its connection) are put back
+# into the queue; duplicate results are dropped; errors and failures are re-raised by the
+# coordinator, which also gives up once all of its local workers have exited
+#
+# the manager unpickles whatever authenticated clients send, so anyone who knows the authkey
+# can run code on the coordinator: use a secret authkey when listening on a public address
+#
+# usage (see also `fab sweepworkers` in aws/fabfile.py, which starts workers on all machines):
+#   coordinator: python -m gasper_attack.sweep --distributed 0.0.0.0:7000 --authkey KEY ...
+#   worker:      python -m gasper_attack.distributed --coordinator HOST:7000 --authkey KEY --processes 2
+#   all on this machine, over loopback: python -m gasper_attack.sweep --local-workers 4 ...
+
+
+class SampleStore(object):
+    # what workers need to build their delay models: the pickled samples, and which nodes and
+    # which eps to build them for; also the duration of a lease (None: leases never expire)
+    def __init__(self, blob, nodes, eps, lease):
+        self.blob = blob
+        self.nodes = nodes
+        self.eps = eps
+        self.lease = lease
+
+    def get(self):
+        return (self.blob, self.nodes, self.eps, self.lease)
+
+
+# state of the coordinator's server process, see init_server
+_tasks = None
+_results = None
+_store = None
+
+
+def init_server(blob, nodes, eps, lease):
+    global _tasks, _results, _store
+    _tasks = queue.Queue()
+    _results = queue.Queue()
+    _store = SampleStore(blob, nodes, eps, lease)
+
+
+def get_tasks():
+    return _tasks
+
+
+def get_results():
+    return _results
+
+
+def get_store():
+    return _store
+
+
+class QueueManager(BaseManager):
+    pass
+
+
+QueueManager.register('tasks', callable=get_tasks)
+QueueManager.register('results', callable=get_results)
+QueueManager.register('store', callable=get_store)
+
+
+def parse_address(address):
+    (host, port) = address.rsplit(':', 1)
+    return (host, int(port))
+
+
+def renew_lease(results, unit, lease, done):
+    # (runs in a thread of the worker while it works on unit; proxies open a connection per thread)
+    while not done.wait(lease / 3):
+        results.put(('renew', unit))
+
+
+def work_loop(address, authkey, lease=None):
+    # take work units off the queue until the coordinator puts None (which is left in the queue
+    # for the other workers); expects the delay models to be loaded already (see worker_main);
+    # failing work units are reported to the coordinator, which re-raises the exception
+    m = QueueManager(address=address, authkey=authkey)
+    m.connect()
+    (tasks, results) = (m.tasks(), m.results())
+    while True:
+        unit = tasks.get()
+        if unit is None:
+            tasks.put(None)
+            return
+        results.put(('taken', unit))
+
+        if lease is not None:
+            done = threading.Event()
+            renewer = threading.Thread(target=renew_lease, args=(results, unit, lease, done), daemon=True)
+            renewer.start()
+        try:
+            results.put(('done', unit, sweep.run_work_unit_in_worker(unit)))
+        except Exception as e:
+            results.put(('error', unit, (e, traceback.format_exc())))
+        finally:
+            if lease is not None:
+                done.set()
+                renewer.join()
+
+
+def worker_main(address, authkey, processes=1):
+    # pull the sample store once, then fork processes that share the delay models
+    m = QueueManager(address=address, authkey=authkey)
+    m.connect()
+    try:
+        (blob, nodes, eps, lease) = m.store().get()
+        store = LazySampleStore(samples=pickle.loads(blob))
+        del blob
+        # build the delay models before forking, so that all processes share them
+        for node in nodes:
+            store.model(node, eps)
+        sweep.init_worker(store, eps)
+    except Exception as e:
+        m.results().put(('failed', None, (e, traceback.format_exc())))
+        raise
+
+    if processes == 1:
+        work_loop(address, authkey, lease)
+        return
+
+    ctx = multiprocessing.get_context('fork')
+    ps = [ ctx.Process(target=work_loop, args=(address, authkey, lease)) for _ in range(processes) ]
+    for p in ps:
+        p.start()
+    for p in ps:
+        p.join()
+
+
+class DistributedBackend(object):
+    # coordinator listening on address (host, port) for workers; with local_workers, that many
+    # worker processes are started on this machine (and connect over loopback); a worker's
+    # lease on a work unit lasts requeue_after seconds (None: forever) and is renewed while the
+    # worker is alive; without authkey, a random one is used (only for loopback addresses, where
+    # all workers are local)
+    POLL = 5   # seconds between checks on the local workers
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, local_workers=0, requeue_after=300):
+        if authkey is None:
+            assert address[0] in ('127.0.0.1', 'localhost'), "a coordinator that is reachable from other machines needs an authkey"
+            authkey = secrets.token_bytes(16)
+        self.address = address
+        self.authkey = authkey
+        self.local_workers = local_workers
+        self.requeue_after = requeue_after
+
+    def run(self, units, samples_filename, eps=None):
+        # yields results in the order in which work units finish
+        units = list(units)
+        nodes = sorted({ u.node for u in units })
+        blob = open(samples_filename, 'rb').read()
+
+        m = QueueManager(address=self.address, authkey=self.authkey)
+        m.start(initializer=init_server, initargs=(blob, nodes, eps, self.requeue_after))
+        del blob
+        print(f"coordinator listening on {m.address[0]}:{m.address[1]}", file=sys.stderr)
+
+        workers = [ multiprocessing.Process(target=worker_main, args=(m.address, self.authkey)) for _ in range(self.local_workers) ]
+        try:
+            (tasks, results) = (m.tasks(), m.results())
+            for u in units:
+                tasks.put(u)
+            for p in workers:
+                p.start()
+
+            outstanding = set(units)
+            leases = {}   # work unit -> expiry of the lease of the worker that took it
+            while outstanding:
+                timeout = self.POLL
+                if leases:
+                    timeout = max(0, min(timeout, min(leases.values()) - time.monotonic()))
+                try:
+                    (kind, unit, *payload) = results.get(timeout=timeout)
+                except queue.Empty:
+                    kind = None
+
+                if kind in ('taken', 'renew') and unit in outstanding and self.requeue_after is not None:
+                    leases[unit] = time.monotonic() + self.requeue_after
+                elif kind == 'done' and unit in outstanding:
+                    outstanding.remove(unit)
+                    leases.pop(unit, None)
+                    yield payload[0]
+                elif kind == 'error' and unit in outstanding:
+                    (e, tb) = payload[0]
+                    print(f"work unit {unit} failed on a worker:\n{tb}", file=sys.stderr)
+                    raise e
+                elif kind == 'failed':
+                    (e, tb) = payload[0]
+                    print(f"a worker failed to start:\n{tb}", file=sys.stderr)
+                    raise e
+
+                # local workers only exit once all work units are done (or if they crashed)
+                if workers and all(p.exitcode is not None for p in workers):
+                    raise RuntimeError(f"all local workers exited (exit codes {[ p.exitcode for p in workers ]}) with {len(outstanding)} work units outstanding")
+
+                now = time.monotonic()
+                for u in [ u for (u, expiry) in leases.items() if expiry <= now ]:
+                    print(f"lease on work unit {u} expired, requeueing", file=sys.stderr)
+                    del leases[u]
+                    tasks.put(u)
+
+            tasks.put(None)
+            for p in workers:
+                p.join()
+        finally:
+            for p in workers:
+                if p.is_alive():
+                    p.terminate()
+            m.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="worker for distributed sweeps of the gasper attack simulation")
+    parser.add_argument('--coordinator', required=True, help="host:port of the coordinator")
+    parser.add_argument('--authkey', required=True)
+    parser.add_argument('--processes', type=int, default=1, help="worker processes on this machine")
+    args = parser.parse_args(argv)
+
+    worker_main(parse_address(args.coordinator), args.authkey.encode(), args.processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import json
+import os
+
+from gasper_attack.attack import Scenario, BalanceTrace, run_attack_simulation
+from gasper_attack.delay_models import SAMPLES_FILENAME, LazySampleStore
+
+
+# gossip propagation measurements
+# these gossip propagation delay samples were obtained as follows:
+# 750 nodes, each on an aws ec2 m6g.medium instance (50 instances each
+# in all 15 aws regions that supported m6g.medium as of 21-apr-2021:
+# eu-north-1, eu-central-1, eu-west-1, eu-west-2, ap-northeast-1,
+# ap-northeast-2, ap-southeast-1, ap-southeast-2, ap-south-1, sa-east-1,
+# ca-central-1, us-east-1, us-east-2, us-west-1, us-west-2);
+# connected via libp2p gossipsub (each node randomly connected to 10 nodes);
+# five nodes with lowest instance id sent beacon messages with inter-transmission
+# times uniformly distributed [0,5] seconds; all nodes log when they receive each
+# message for the first time; later, the logs are collected and for each message
+# and each receiver the delay is recorded; the samples are grouped first by sender
+# of the message, then by the message, and then by the receiver; in the attack
+# simulation, a certain sending node is picked to be the adversary, and the
+# propagation delay for adversarial messages to their receivers is modelled by
+# using the measured delays of a randomly chosen message of that sender, to
+# a randomly chosen receiver (but without replacement of receivers)
+# sending nodes:
+# node 0: id: i-000ff4115b14690cb, location: us-east-2, optimal T_delay: ~100ms
+# node 1: id: i-00108a6bf2add4e7f, location: ap-northeast-1, optimal T_delay: ~130ms
+# node 2: id: i-00120f892976c76e2, location: us-east-1, optimal T_delay: ~85ms
+# node 3: id: i-0015999915e28fcfb, location: ap-northeast-1, optimal T_delay: ~140ms
+# node 4: id: i-0017d5257cae82d0a, location: ap-northeast-2, optimal T_delay: ~165ms
+# (these are the samples in SAMPLES_FILENAME, which is only loaded once a delay model is
+# requested from the store)
+
+
+def format_interval(interval, scale=1):
+    if interval[0] is None:
+        return "n/a"
+    return f"{interval[0]*scale:.1f}..{interval[1]*scale:.1f}"
+
+
+def load_finished_runs(filename):
+    # outcomes of the runs that an earlier (interrupted) grid search finished: (T_delay, random
+    # try) -> record; a last line that was only partially written is dropped from the file
+    finished = {}
+    if os.path.exists(filename):
+        data = open(filename, 'rb').read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            with open(filename, 'r+b') as f:
+                f.truncate(end)
+        for l in data[:end].decode().splitlines():
+            r = json.loads(l)
+            finished[(r['T_delay'], r['rnd_try'])] = r
+    return finished
+
+
+def grid_search_T_delay(scenario, gossip_propagation_samples, num_slots_simulate, T_delays, num_launched=10, trace_len=0, trace_stride=1, trace_out=None, checkpoint=None, checkpoint_every=None, level=0.95):
+    # grid search the optimal delay parameter for the adversary; returns (T_delay in ms, avg
+    # number of slots for which liveness was stalled) for every T_delay, and prints both
+    # estimates with confidence intervals at the given level (see gasper_attack.analysis; the
+    # tries stop after num_launched launched attacks, while the launch probability intervals
+    # assume a fixed number of tries, so they are only approximate, see sweep_result_intervals)
+    # for long horizons: every run keeps a BalanceTrace of at most trace_len entries (one every
+    # trace_stride slots), which is written to trace_out (.jsonl) for launched attacks; with
+    # checkpoint (a filename prefix), each run is checkpointed every checkpoint_every slots, and
+    # the outcome of every finished run is appended to a .jsonl file, so that re-running after
+    # an interruption skips the finished runs and resumes the interrupted one; both filenames
+    # name the scenario, the horizon and the delay model (by fingerprint), so that a different
+    # configuration never picks up these files
+    # (numpy is only imported here, when the first intervals are computed)
+    from gasper_attack.analysis import attack_outcome_intervals
+
+    finished = {}
+    if checkpoint:
+        checkpoint = f"{checkpoint}-C{scenario.C}-N{scenario.N}-F{scenario.F}-{num_slots_simulate}slots-{gossip_propagation_samples.fingerprint()[:16]}"
+        finished = load_finished_runs(f"{checkpoint}-finished.jsonl")
+        finished_out = open(f"{checkpoint}-finished.jsonl", 'a')
+
+    performance = []
+    for T_delay in T_delays:
+        print(f"* T_delay = {int(T_delay*1000)}ms")
+
+        attack_outcomes = []
+        rnd_tries = 0
+        while len([ r for r in attack_outcomes if r > 0 ]) < num_launched:
+            if (T_delay, rnd_tries) in finished:
+                r = finished[(T_delay, rnd_tries)]
+                if r['stall'] > 0:
+                    print(f"attack launched at random sample {rnd_tries}, stalled liveness for {r['stall']} slots "
+                          f"(max imbalance {r['max_imbalance']} at slot {r['max_imbalance_slot']}, "
+                          f"min adversarial votes remaining {r['min_adv_votes_remaining']}; finished before)")
+                attack_outcomes.append(r['stall'])
+                rnd_tries += 1
+                continue
+
+            balances = BalanceTrace(maxlen=trace_len, stride=trace_stride)
+            checkpoint_filename = f"{checkpoint}-{int(T_delay*1000)}ms-{rnd_tries}.pickle" if checkpoint else None
+            (runtime, balances) = run_attack_simulation(scenario, gossip_propagation_samples, num_slots_simulate, rnd_tries, T_delay, balances, checkpoint_filename, checkpoint_every)
+            if checkpoint:
+                finished_out.write(json.dumps({
+                    'T_delay': T_delay, 'rnd_try': rnd_tries, 'stall': runtime,
+                    'max_imbalance': balances.max_imbalance, 'max_imbalance_slot': balances.max_imbalance_slot,
+                    'min_adv_votes_remaining': balances.min_adv_votes_remaining,
+                }) + '\n')
+                finished_out.flush()
+                os.fsync(finished_out.fileno())
+            if runtime > 0:
+                print(f"attack launched at random sample {rnd_tries}, stalled liveness for {runtime} slots "
+                      f"(max imbalance {balances.max_imbalance} at slot {balances.max_imbalance_slot}, "
+                      f"min adversarial votes remaining {balances.min_adv_votes_remaining})")
+                if trace_out:
+                    trace_out.write(json.dumps({
+                        'T_delay': T_delay, 'rnd_try': rnd_tries, 'stall': runtime,
+                        'max_imbalance': balances.max_imbalance, 'max_imbalance_slot': balances.max_imbalance_slot,
+                        'min_adv_votes_remaining': balances.min_adv_votes_remaining,
+                        'balances': list(balances),
+                    }) + '\n')
+                    trace_out.flush()
+            attack_outcomes.append(runtime)
+            rnd_tries += 1
+
+        ci = attack_outcome_intervals(attack_outcomes, level)
+        print(f"-> attack launched in {len([ r for r in attack_outcomes if r > 0 ])} of {len(attack_outcomes)} epochs = {ci['launch_probability']*100:.1f}% probability "
+              f"({level*100:g}% CI {format_interval(ci['launch_probability_ci'], 100)}% bootstrap, {format_interval(ci['launch_probability_wilson'], 100)}% Wilson)")
+        print(f"-> attack stalled liveness for avg of {sum([ r for r in attack_outcomes if r > 0 ])/len([ r for r in attack_outcomes if r > 0 ])} slots "
+              f"({level*100:g}% CI {format_interval(ci['mean_stall_ci'])} bootstrap, {format_interval(ci['mean_stall_normal'])} normal)")
+        print()
+        performance.append((T_delay*1000, sum([ r for r in attack_outcomes if r > 0 ])/len([ r for r in attack_outcomes if r > 0 ])))
+
+    if checkpoint:
+        finished_out.close()
+    return performance
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="gasper balancing attack with measured gossip propagation delays")
+    parser.add_argument('--samples', default=SAMPLES_FILENAME, help="samples_simplified_ID.pickle")
+    parser.add_argument('--node', type=int, default=4, help="sending node whose delays model the adversary's messages")
+    # to keep the model small (cache-resident), each message's delays can instead be summarized by a
+    # table of quantiles with rank error bound eps (see QuantileGossipPropagationDelayModel;
+    # python -m gasper_attack.delay_models <pickle> reports the memory savings and fidelity loss)
+    parser.add_argument('--eps', type=float, default=None, help="use a quantile-table delay model with this error bound (e.g., 0.01)")
+    parser.add_argument('--C', type=int, default=32, help="number of slots per epoch")
+    parser.add_argument('--N', type=int, default=4096, help="number of validators")
+    parser.add_argument('--F', type=float, default=0.15, help="adversarial fraction")
+    parser.add_argument('--epochs', type=int, default=25, help="attack horizon in epochs")
+    parser.add_argument('--launched', type=int, default=10, help="launched attacks per T_delay")
+    parser.add_argument('--level', type=float, default=0.95, help="confidence level of the reported intervals")
+    # for attacks that stall liveness for thousands of epochs, raise the horizon, bound the balance
+    # traces, and checkpoint the runs, e.g., --epochs 10000 --trace-len 10000 --trace-stride 32
+    # --trace-out traces.jsonl --checkpoint ckpt --checkpoint-every 100
+    parser.add_argument('--trace-len', type=int, default=0, help="keep the balance of at most this many slots per run (the most recent ones)")
+    parser.add_argument('--trace-stride', type=int, default=1, help="keep the balance of every this many slots")
+    parser.add_argument('--trace-out', help="write the balance traces of launched attacks to this .jsonl file")
+    parser.add_argument('--checkpoint', metavar='PREFIX', help="checkpoint runs to PREFIX-<configuration>-<T_delay>ms-<try>.pickle and record finished runs, and resume from there")
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="checkpoint every this many epochs")
+    args = parser.parse_args(argv)
+
+    # parameters of the scenario
+    scenario = Scenario(args.C, args.N, int(args.F * args.N))
+
+    # load gossip propagation measurements
+    gossip_propagation_samples = LazySampleStore(args.samples).model(args.node, args.eps)
+
+    # attack horizon
+    num_slots_simulate = args.epochs * scenario.C
+
+    trace_out = open(args.trace_out, 'w') if args.trace_out else None
+    try:
+        performance = grid_search_T_delay(scenario, gossip_propagation_samples, num_slots_simulate, [ x*0.001 for x in range(80, 180+1, 5) ], num_launched=args.launched,
+                                          trace_len=args.trace_len, trace_stride=args.trace_stride, trace_out=trace_out,
+                                          checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every * scenario.C, level=args.level)
+    finally:
+        if trace_out:
+            trace_out.close()
+    # print(performance)
+
+
+if __name__ == '__main__':
+    main()
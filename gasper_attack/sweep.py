@@ -0,0 +1,252 @@
+from __future__ import annotations
+from dataclasses import dataclass, asdict
+import itertools
+import sys
+
+from gasper_attack.attack import Scenario, BalanceTrace, run_attack_simulation
+from gasper_attack.delay_models import LazySampleStore
+
+
+# sweep over the parameters of gasper-attack-measured-gossip-propagation-delay.py (sending node,
+# adversarial fraction F, slots per epoch C, adversary delay T_delay) in one process tree: each
+# configuration is a WorkUnit; worker processes load the delay models once and keep them (and the
+# cached committee schedules, see gasper_attack.attack.epoch_permutation) across work units;
+# results are written to CSV/JSONL as soon as each work unit finishes; modules that are not
+# needed to run work units (multiprocessing, csv, json, ...) are imported where they are used, so
+# that importing this module in a worker is cheap
+#
+# usage:
+#   python -m gasper_attack.sweep --samples samples_simplified_ID.pickle --node 0 1 2 3 4 \
+#       --F 0.15 0.2 --C 32 --T-delay 80:180:5 --out results.jsonl
+# (for running the work units on many machines, see gasper_attack.distributed)
+
+
+@dataclass(frozen=True)
+class WorkUnit(object):
+    node: int        # sending node whose measured delays model the adversary's messages
+    F: float         # adversarial fraction
+    C: int           # number of slots per epoch
+    T_delay: float   # seconds
+    N: int = 4096    # number of validators
+    num_epochs: int = 25      # attack horizon
+    num_launched: int = 10    # number of launched attacks to average over
+    max_tries: int = None     # give up after this many random tries (None: never)
+
+    def scenario(self):
+        return Scenario(self.C, self.N, int(self.F * self.N))
+
+
+def run_work_unit(unit, gossip_propagation_samples):
+    # same as the grid search of gasper-attack-measured-gossip-propagation-delay.py, for one
+    # configuration: try random schedules until the attack could be launched num_launched times
+    scenario = unit.scenario()
+    num_slots_simulate = unit.num_epochs * scenario.C
+
+    attack_outcomes = []
+    traces = []
+    rnd_tries = 0
+    while len([ r for r in attack_outcomes if r > 0 ]) < unit.num_launched:
+        if unit.max_tries is not None and rnd_tries >= unit.max_tries:
+            break
+        # only the summary statistics of the balance trace are reported, so keep no slots
+        (runtime, balances) = run_attack_simulation(scenario, gossip_propagation_samples, num_slots_simulate, rnd_tries, unit.T_delay, BalanceTrace(maxlen=0))
+        attack_outcomes.append(runtime)
+        if runtime > 0:
+            traces.append(balances)
+        rnd_tries += 1
+
+    stalls = [ r for r in attack_outcomes if r > 0 ]
+    return {
+        **asdict(unit),
+        'tries': len(attack_outcomes),
+        'launched': len(stalls),
+        'launch_probability': len(stalls) / len(attack_outcomes) if attack_outcomes else None,
+        'mean_stall': sum(stalls) / len(stalls) if stalls else None,
+        'stalls': stalls,
+        # over all launched attacks
+        'max_imbalance': max([ t.max_imbalance for t in traces ]) if traces else None,
+        'min_adv_votes_remaining': min([ t.min_adv_votes_remaining for t in traces if t.min_adv_votes_remaining is not None ], default=None),
+    }
+
+
+# sample store of the current (worker) process, see init_worker; the samples are loaded, and the
+# delay models built, when the first work unit needs them, and then kept for all further units
+_store = None
+_eps = None
+
+
+def init_worker(store, eps=None):
+    # store: a LazySampleStore, or the filename of the samples; a store for the same file as the
+    # current one is kept (with its delay models, which are cached per node and eps), so that
+    # repeated in-process sweeps over the same samples load them only once
+    global _store, _eps
+    if not isinstance(store, LazySampleStore):
+        if _store is not None and _store.filename == store:
+            store = _store
+        else:
+            store = LazySampleStore(store)
+    _store = store
+    _eps = eps
+
+
+def run_work_unit_in_worker(unit):
+    return run_work_unit(unit, _store.model(unit.node, _eps))
+
+
+class LocalBackend(object):
+    # runs work units on a pool of worker processes on this machine (processes=1: in this process)
+
+    def __init__(self, processes=None):
+        self.processes = processes
+
+    def run(self, units, samples_filename, eps=None):
+        # yields results in the order in which work units finish
+        units = list(units)
+
+        if self.processes == 1:
+            init_worker(samples_filename, eps)
+            for u in units:
+                yield run_work_unit_in_worker(u)
+            return
+
+        import multiprocessing
+        with multiprocessing.Pool(self.processes, initializer=init_worker, initargs=(samples_filename, eps)) as pool:
+            for result in pool.imap_unordered(run_work_unit_in_worker, units):
+                yield result
+
+
+class ResultWriter(object):
+    # appends one line per result to a .csv or .jsonl file (by extension), flushing after each
+    # line; CSV rows leave out the list of individual stalls
+    CSV_FIELDS = ['node', 'F', 'C', 'T_delay', 'N', 'num_epochs', 'num_launched', 'max_tries', 'tries', 'launched', 'launch_probability', 'mean_stall', 'max_imbalance', 'min_adv_votes_remaining',
+                  'launch_probability_ci_low', 'launch_probability_ci_high', 'launch_probability_wilson_low', 'launch_probability_wilson_high',
+                  'mean_stall_ci_low', 'mean_stall_ci_high', 'mean_stall_normal_low', 'mean_stall_normal_high']
+
+    def __init__(self, filename):
+        import csv
+        self.csv = filename.endswith('.csv')
+        self.f = open(filename, 'w', newline='')
+        if self.csv:
+            self.writer = csv.DictWriter(self.f, self.CSV_FIELDS, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, result):
+        if self.csv:
+            self.writer.writerow(result)
+        else:
+            import json
+            self.f.write(json.dumps(result) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def add_intervals(result, level=0.95):
+    # confidence intervals for launch probability and mean stall duration (see
+    # gasper_attack.analysis), as <estimate>_ci_low/high (bootstrap) and
+    # <estimate>_wilson_low/high resp. <estimate>_normal_low/high (analytic)
+    from gasper_attack.analysis import sweep_result_intervals
+    intervals = sweep_result_intervals(result, level)
+    for k in ['launch_probability_ci', 'launch_probability_wilson', 'mean_stall_ci', 'mean_stall_normal']:
+        (result[k + '_low'], result[k + '_high']) = intervals[k]
+    return result
+
+
+def parameter_grid(nodes, Fs, Cs, T_delays, **kwargs):
+    # all combinations of the parameters, as work units (kwargs: further WorkUnit fields)
+    return [ WorkUnit(node, F, C, T_delay, **kwargs) for (node, F, C, T_delay) in itertools.product(nodes, Fs, Cs, T_delays) ]
+
+
+def sweep(units, samples_filename, out=None, backend=None, eps=None, level=0.95):
+    # runs all work units and yields their results as they come in, with confidence intervals
+    # at the given level (None: without); with out, results are also streamed to that file
+    # (use list(sweep(...)) to collect all results)
+    backend = backend or LocalBackend()
+    writer = ResultWriter(out) if out else None
+    try:
+        for result in backend.run(units, samples_filename, eps):
+            if level is not None:
+                add_intervals(result, level)
+            if writer:
+                writer.write(result)
+            yield result
+    finally:
+        if writer:
+            writer.close()
+
+
+def parse_values(values, type=float, scale=1):
+    # list of values, where "start:stop:step" stands for start, start+step, ..., stop (inclusive)
+    ret = []
+    for v in values:
+        if ':' in v:
+            (start, stop, step) = [ type(x) for x in v.split(':') ]
+            n = int(round((stop - start) / step))
+            ret += [ (start + i*step) * scale for i in range(n + 1) ]
+        else:
+            ret.append(type(v) * scale)
+    return ret
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="sweep the gasper attack simulation over a parameter grid")
+    parser.add_argument('--samples', required=True, help="samples_simplified_ID.pickle")
+    parser.add_argument('--node', nargs='+', default=['0:4:1'], help="sending node(s) modelling the adversary")
+    parser.add_argument('--F', nargs='+', default=['0.15'], help="adversarial fraction(s)")
+    parser.add_argument('--C', nargs='+', default=['32'], help="slots per epoch")
+    parser.add_argument('--T-delay', nargs='+', default=['80:180:5'], help="adversary delay(s) in ms")
+    parser.add_argument('--N', type=int, default=4096, help="number of validators")
+    parser.add_argument('--epochs', type=int, default=25, help="attack horizon in epochs")
+    parser.add_argument('--launched', type=int, default=10, help="launched attacks per configuration")
+    parser.add_argument('--max-tries', type=int, default=None, help="give up on a configuration after this many tries")
+    parser.add_argument('--eps', type=float, default=None, help="use quantile-table delay models with this error bound")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--distributed', metavar='HOST:PORT', help="coordinate remote workers (see gasper_attack.distributed), listening here")
+    parser.add_argument('--local-workers', type=int, default=0, help="with --distributed (or alone, on loopback): also start this many local workers")
+    parser.add_argument('--authkey', help="shared secret of coordinator and workers (required with --distributed; keep it secret, the coordinator unpickles what workers send)")
+    parser.add_argument('--requeue-after', type=float, default=300, help="requeue work units whose worker has not been heard of for this many seconds")
+    parser.add_argument('--out', default='results.jsonl', help="output file (.jsonl or .csv)")
+    parser.add_argument('--level', type=float, default=0.95, help="confidence level of the reported intervals")
+    args = parser.parse_args(argv)
+
+    units = parameter_grid(
+        parse_values(args.node, int),
+        parse_values(args.F),
+        parse_values(args.C, int),
+        parse_values(args.T_delay, scale=0.001),
+        N=args.N,
+        num_epochs=args.epochs,
+        num_launched=args.launched,
+        max_tries=args.max_tries,
+    )
+    if args.distributed and not args.authkey:
+        parser.error("--distributed requires --authkey")
+    print(f"{len(units)} configurations", file=sys.stderr)
+
+    if args.distributed or args.local_workers:
+        from gasper_attack.distributed import DistributedBackend, parse_address
+        # (with only local workers, on loopback, a random authkey is used)
+        backend = DistributedBackend(parse_address(args.distributed) if args.distributed else ('127.0.0.1', 0), args.authkey.encode() if args.authkey else None, args.local_workers, args.requeue_after)
+    else:
+        backend = LocalBackend(args.processes)
+
+    for result in sweep(units, args.samples, args.out, backend, args.eps, args.level):
+        print(f"node {result['node']}, F = {result['F']}, C = {result['C']}, T_delay = {int(round(result['T_delay']*1000))}ms: "
+              f"launched in {result['launched']} of {result['tries']} tries "
+              f"(probability {result['launch_probability']}, CI {result['launch_probability_ci_low']}..{result['launch_probability_ci_high']}), "
+              f"stalled liveness for avg of {result['mean_stall']} slots (CI {result['mean_stall_ci_low']}..{result['mean_stall_ci_high']})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    # run main() of the imported module rather than of __main__, so that work units are pickled
+    # as gasper_attack.sweep.WorkUnit (which remote workers can unpickle)
+    from gasper_attack.sweep import main
+    main()
@@ -0,0 +1,180 @@
+from __future__ import annotations
+import random
+import math
+import bisect
+
+from gasper_attack.delay_models import SAMPLES_FILENAME, LazySampleStore
+
+
+def simulate_vote_after_propagation_and_intercept(rng, gossip_propagation_samples, n_honest, adversaries, i_adversary_alert, T_adversary_delay):
+    # sample a random location for the block proposer and a corresponding block propagation delay distribution
+    proposer = rng.choice(range(len(gossip_propagation_samples)))
+    i_msg = rng.randrange(len(gossip_propagation_samples[proposer]))
+    proposer_msg_dist = gossip_propagation_samples[proposer].instance(i_msg)
+
+    # sample the delay from block proposer to adversarial nodes
+    # and determine when adversaries begin broadcasting the sway vote
+    # (i.e., the i_adversary_alert-th order statistic of len(adversaries) delays, whose
+    # distribution is tabulated once per proposer message)
+    T_adv = gossip_propagation_samples[proposer].order_statistic_sampler(i_msg, len(adversaries), i_adversary_alert).sample(rng)
+
+    # sample propagation delay distribution for each adversarial node (given its location)
+    adv_msg_dist = [ gossip_propagation_samples[adv].sample(rng) for adv in adversaries ]
+
+    # for each honest committee member ...
+    hons = []
+    for j in range(n_honest):
+        # ... sample the delay of block proposal
+        T_proposal = proposer_msg_dist.sample(rng, 1)[0]
+        # ... sample the delay of sway vote
+        T_advs = [ dist.sample(rng, 1)[0] + T_adv + T_adversary_delay for (i, dist) in enumerate(adv_msg_dist) ]
+
+        # ... depending on whether block proposal or sway vote arrive first ...
+        if T_proposal < min(T_advs):
+            hons.append(0) # ... vote with tie break
+        else:
+            hons.append(1) # ... vote with sway
+
+    return hons
+
+
+def simulate_sway_fractions_for_alert_and_delay_grid(rng, gossip_propagation_samples, n_honest, adversaries, i_adversary_alerts, T_adversary_delays):
+    # same as simulate_vote_after_propagation_and_intercept, but for all combinations of
+    # i_adversary_alert and T_adversary_delay at once (returns the fraction of honest validators
+    # voting with sway, indexed [i_adversary_alert][T_adversary_delay]); an honest validator votes
+    # with sway iff T_proposal >= min(T_advs) + T_adv + T_adversary_delay, so only the difference
+    # T_proposal - min(T_advs) (its "slack") needs to be sampled per honest validator, once for
+    # all combinations; then, per i_adversary_alert, T_adv is drawn from the tabulated order
+    # statistics, and per T_adversary_delay, the sway votes are counted by bisection in the slacks
+    proposer = rng.choice(range(len(gossip_propagation_samples)))
+    i_msg = rng.randrange(len(gossip_propagation_samples[proposer]))
+    proposer_msg_dist = gossip_propagation_samples[proposer].instance(i_msg)
+
+    adv_msg_dist = [ gossip_propagation_samples[adv].sample(rng) for adv in adversaries ]
+
+    slacks = sorted(proposer_msg_dist.sample(rng, 1)[0] - min(dist.sample(rng, 1)[0] for dist in adv_msg_dist) for j in range(n_honest))
+
+    fractions = []
+    for i_adversary_alert in i_adversary_alerts:
+        T_adv = gossip_propagation_samples[proposer].order_statistic_sampler(i_msg, len(adversaries), i_adversary_alert).sample(rng)
+        fractions.append([ (n_honest - bisect.bisect_left(slacks, T_adv + T_adversary_delay)) / n_honest for T_adversary_delay in T_adversary_delays ])
+
+    return fractions
+
+
+def mean(lst):
+    return sum(lst)/len(lst)
+
+def variance(lst):
+    m = mean(lst)
+    return mean([ (l-m)**2 for l in lst ])
+
+def stddev(lst):
+    return math.sqrt(variance(lst))
+
+
+def run_experiments(rng, gossip_propagation_samples, n_committee_honest, adversaries, i_adversary_alert, T_delay, num_experiments=10000):
+    # Monte Carlo experiments; returns the fraction of honest validators voting with sway per experiment
+    results = []
+    for i in range(num_experiments):
+        hons = simulate_vote_after_propagation_and_intercept(rng, gossip_propagation_samples, n_committee_honest, adversaries, i_adversary_alert, T_delay)
+        results.append(sum(hons)/len(hons))
+    return results
+
+
+def run_sweep(rng, gossip_propagation_samples, n_committee_honest, adversaries, i_adversary_alert_sweep, T_delay_sweep, num_experiments=10000):
+    # Monte Carlo experiments for all combinations of i_adversary_alert and T_delay (at roughly
+    # the cost of one configuration); returns the fractions of honest validators voting with sway
+    # per experiment, indexed [i_adversary_alert][T_delay]
+    results = [ [ [] for T in T_delay_sweep ] for i in i_adversary_alert_sweep ]
+    for i in range(num_experiments):
+        fractions = simulate_sway_fractions_for_alert_and_delay_grid(rng, gossip_propagation_samples, n_committee_honest, adversaries, i_adversary_alert_sweep, T_delay_sweep)
+        for (r, f) in zip(results, fractions):
+            for (rr, ff) in zip(r, f):
+                rr.append(ff)
+    return results
+
+
+# plotting imports matplotlib only when a plot is made, as it dominates startup time
+
+def plot_histogram(results, filename):
+    import matplotlib.pyplot as plt
+    plt.figure()
+    p = plt.hist(results)
+    plt.xlim(0, 1)
+    plt.savefig(filename)
+    return p
+
+
+def plot_heatmap(means, i_adversary_alert_sweep, T_delay_sweep, filename):
+    import matplotlib.pyplot as plt
+    plt.figure()
+    plt.imshow(means, origin='lower', aspect='auto', vmin=0, vmax=1,
+               extent=(T_delay_sweep[0]*1000, T_delay_sweep[-1]*1000, i_adversary_alert_sweep[0] - 0.5, i_adversary_alert_sweep[-1] + 0.5))
+    plt.colorbar(label='fraction of honest validators voting with sway')
+    plt.xlabel('T_delay [ms]')
+    plt.ylabel('i_adversary_alert')
+    plt.savefig(filename)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="eth2 attack with unknown proposal time")
+    parser.add_argument('--samples', default=SAMPLES_FILENAME, help="samples_simplified_ID.pickle (uncompress provided pickle file first!)")
+    parser.add_argument('--eps', type=float, default=None, help="summarize each message by a compact quantile table with this error bound instead (see QuantileGossipPropagationDelayModel)")
+    parser.add_argument('--experiments', type=int, default=10000, help="number of Monte Carlo experiments")
+    parser.add_argument('--honest', type=int, default=120, help="number of honest committee members (ignoring random draw)")
+    parser.add_argument('--adversaries', type=int, default=25, help="number of adversarial nodes in the network")
+    parser.add_argument('--adversary-node', type=int, default=2, help="\"position\" (propagation delay CDF) of the adversarial nodes")
+    parser.add_argument('--alert', type=int, default=4, help="adversary releases sway vote when this many adversarial nodes have received this slot's proposal")
+    parser.add_argument('--T-delay', type=float, default=0.0, help="delay between when --alert adversarial nodes have received this slot's proposal and release of sway vote")
+    # sweep mode: instead of the single configuration above, run the Monte Carlo experiments for all
+    # combinations of these i_adversary_alert and T_delay, and plot the mean fraction of honest
+    # validators voting with sway as a heatmap
+    parser.add_argument('--sweep-alert', type=int, nargs='+', default=None, help="sweep mode: values of --alert, e.g., 0 1 ... 24")
+    parser.add_argument('--sweep-T-delay', type=float, nargs='+', default=None, help="sweep mode: values of --T-delay, e.g., 0.0 0.005 ... 0.2")
+    parser.add_argument('--no-plot', action='store_true', help="only print numbers")
+    args = parser.parse_args(argv)
+
+    # load gossip network propagation samples
+    store = LazySampleStore(args.samples)
+    gossip_propagation_samples = [ store.model(i, args.eps) for i in range(len(store.senders())) ]
+
+    # reproducibility
+    rng = random.Random(2342)
+
+    # scenario
+    n_committee_honest = args.honest
+    adversaries = [args.adversary_node,]*args.adversaries
+    i_adversary_alert = args.alert
+    T_delay = args.T_delay
+
+    if args.sweep_alert is not None or args.sweep_T_delay is not None:
+        i_adversary_alert_sweep = args.sweep_alert or [i_adversary_alert]
+        T_delay_sweep = args.sweep_T_delay or [T_delay]
+        results = run_sweep(rng, gossip_propagation_samples, n_committee_honest, adversaries, i_adversary_alert_sweep, T_delay_sweep, args.experiments)
+
+        means = [ [ mean(rr) for rr in r ] for r in results ]
+        for (i_alert, r) in zip(i_adversary_alert_sweep, results):
+            print(i_alert, [ (int(T*1000), mean(rr), stddev(rr)) for (T, rr) in zip(T_delay_sweep, r) ])   # stats per configuration
+
+        if not args.no_plot:
+            plot_heatmap(means, i_adversary_alert_sweep, T_delay_sweep, f"eth2-attack-unknown-proposal-time-adv{len(adversaries)}-sweep.png")
+
+    else:
+        results = run_experiments(rng, gossip_propagation_samples, n_committee_honest, adversaries, i_adversary_alert, T_delay, args.experiments)
+
+        print(results)   # fraction of honest validators voting with sway per experiment
+        print(mean(results), variance(results), stddev(results), math.sqrt(mean(results) * (1-mean(results))))   # stats
+
+        if not args.no_plot:
+            # plot histogram
+            p = plot_histogram(results, f"eth2-attack-unknown-proposal-time-adv{len(adversaries)}-i{i_adversary_alert}-T{T_delay}.png")
+
+            # raw data of the histogram
+            print(p[0])
+            print(p[1])
+
+
+if __name__ == '__main__':
+    main()